@@ -20,30 +20,155 @@
 
 import argparse
 import asyncio
+import dataclasses
+import io
 import itertools
+import logging
 import re
-import xml.etree.ElementTree as ET
+import sys
 from collections import Counter
 from dataclasses import field
-from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING, Iterable, Iterator, NamedTuple, Optional
 
 import aiohttp
 import aiohttp.web
 import jinja2
 import yaml
 
+try:
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET  # type: ignore
+    HAVE_LXML = False
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None  # type: ignore
+
 if TYPE_CHECKING:
     from dataclasses import dataclass
 else:
     from pydantic.dataclasses import dataclass
 
 
+@lru_cache(maxsize=256)
+def compile_filter(pattern: Optional[str]) -> Optional[re.Pattern[str]]:
+    return re.compile(pattern, re.IGNORECASE) if pattern is not None else None
+
+
+# constructs hyperscan accepts, but interprets differently from python re:
+# {,n} quantifiers, POSIX [:classes:] and \s (which is wider in python)
+HYPERSCAN_INCOMPATIBLE = re.compile(r'\{,|\[:|\\[sS]')
+
+
+def is_hyperscan_compatible(pattern: str) -> bool:
+    return HYPERSCAN_INCOMPATIBLE.search(pattern) is None
+
+
+def compile_hyperscan(patterns: list[str]) -> Optional['hyperscan.Database']:
+    if not patterns:
+        return None
+
+    # anchors mimic re.fullmatch, and flags mimic re.IGNORECASE on str patterns
+    flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_ALLOWEMPTY | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+
+    database = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    database.compile(
+        expressions=[f'\\A(?:{pattern})\\z'.encode('utf-8') for pattern in patterns],
+        ids=list(range(len(patterns))),
+        elements=len(patterns),
+        flags=[flags] * len(patterns),
+    )
+    return database
+
+
+def match_hyperscan(database: Optional['hyperscan.Database'], text: str) -> bool:
+    if database is None:
+        return False
+
+    matched = False
+
+    def on_match(*args: object) -> None:
+        nonlocal matched
+        matched = True
+
+    database.scan(text.encode('utf-8'), match_event_handler=on_match)
+
+    return matched
+
+
 @dataclass
 class FilterConfig:
     title: Optional[str] = None
     category: Optional[str] = None
     creator: Optional[str] = None
 
+    @cached_property
+    def title_re(self) -> Optional[re.Pattern[str]]:
+        return compile_filter(self.title)
+
+    @cached_property
+    def category_re(self) -> Optional[re.Pattern[str]]:
+        return compile_filter(self.category)
+
+    @cached_property
+    def creator_re(self) -> Optional[re.Pattern[str]]:
+        return compile_filter(self.creator)
+
+
+class FilterMatcher:
+    _title_patterns: list[re.Pattern[str]]
+    _creator_patterns: list[re.Pattern[str]]
+    _category_patterns: list[re.Pattern[str]]
+    _databases: Optional[tuple[Optional['hyperscan.Database'], ...]]
+
+    def __init__(self, filters: list[FilterConfig]) -> None:
+        # filters are split by field so cheap single string fields are
+        # checked first, and category lists are only scanned if needed
+        self._title_patterns = [filt.title_re for filt in filters if filt.title_re is not None]
+        self._creator_patterns = [filt.creator_re for filt in filters if filt.creator_re is not None]
+        self._category_patterns = [filt.category_re for filt in filters if filt.category_re is not None]
+        self._databases = None
+
+        patterns = self._title_patterns + self._creator_patterns + self._category_patterns
+
+        if hyperscan is not None:
+            if incompatible := [pattern.pattern for pattern in patterns if not is_hyperscan_compatible(pattern.pattern)]:
+                logging.warning(f'hyperscan interprets filter patterns {incompatible} differently, falling back to python regexps')
+            else:
+                try:
+                    self._databases = (
+                        compile_hyperscan([pattern.pattern for pattern in self._title_patterns]),
+                        compile_hyperscan([pattern.pattern for pattern in self._creator_patterns]),
+                        compile_hyperscan([pattern.pattern for pattern in self._category_patterns]),
+                    )
+                except hyperscan.error as e:
+                    # some pattern is not supported by hyperscan (e.g. backreferences or \b)
+                    logging.warning(f'hyperscan cannot compile filter patterns ({e}), falling back to python regexps')
+
+    def match(self, item: 'FeedItem') -> bool:
+        if self._databases is not None:
+            title_database, creator_database, category_database = self._databases
+
+            if match_hyperscan(title_database, item.title):
+                return True
+            if match_hyperscan(creator_database, item.creator):
+                return True
+            if any(match_hyperscan(category_database, category) for category in item.categories):
+                return True
+            return False
+
+        if any(pattern.fullmatch(item.title) for pattern in self._title_patterns):
+            return True
+        if any(pattern.fullmatch(item.creator) for pattern in self._creator_patterns):
+            return True
+        if any(pattern.fullmatch(category) for pattern in self._category_patterns for category in item.categories):
+            return True
+        return False
+
 
 @dataclass
 class FeedConfig:
@@ -52,13 +177,22 @@ class FeedConfig:
     exclude: list[FilterConfig] = field(default_factory=list)
     include: list[FilterConfig] = field(default_factory=list)
 
+    @cached_property
+    def exclude_matcher(self) -> FilterMatcher:
+        return FilterMatcher(self.exclude)
+
+    @cached_property
+    def include_matcher(self) -> FilterMatcher:
+        return FilterMatcher(self.include)
+
 
 @dataclass
 class FeedsConfig:
     feeds: list[FeedConfig]
 
 
-@dataclass
+# internal, constructed by parse_feed, so does not need pydantic validation
+@dataclasses.dataclass(slots=True)
 class FeedItem:
     title: str
     guid: str
@@ -71,11 +205,13 @@ class FeedItem:
 
     @staticmethod
     def unicalize(items: Iterable['FeedItem']) -> Iterator['FeedItem']:
-        seen_guids = set()
+        seen_guids: set[str] = set()
+        seen_guids_add = seen_guids.add
 
         for item in items:
-            if item.guid not in seen_guids:
-                seen_guids.add(item.guid)
+            guid = item.guid
+            if guid not in seen_guids:
+                seen_guids_add(guid)
                 yield item
 
     def __repr__(self) -> str:
@@ -89,10 +225,59 @@ class FeedItem:
         return res
 
 
-@dataclass
+class UpstreamFeed(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_type: str
+    items: list[FeedItem]
+
+
+class StatisticsItem(NamedTuple):
+    title: str
+    link: str
+    creator: str
+    categories: tuple[str, ...]
+
+
 class FilterStatistics:
-    passed: dict[str, FeedItem] = field(default_factory=dict)
-    blocked: dict[str, FeedItem] = field(default_factory=dict)
+    # only fields shown on the statistics page are kept, as items
+    # accumulate here for the whole lifetime of the process
+    passed: dict[str, StatisticsItem]
+    blocked: dict[str, StatisticsItem]
+
+    _passed_categories: Counter[str]
+    _blocked_categories: Counter[str]
+    _passed_creators: Counter[str]
+    _blocked_creators: Counter[str]
+
+    _passed_sorted: Optional[list[tuple[str, StatisticsItem]]]
+    _blocked_sorted: Optional[list[tuple[str, StatisticsItem]]]
+
+    dirty: bool
+
+    def __init__(self) -> None:
+        self.passed = {}
+        self.blocked = {}
+        self._passed_categories = Counter()
+        self._blocked_categories = Counter()
+        self._passed_creators = Counter()
+        self._blocked_creators = Counter()
+        self._passed_sorted = None
+        self._blocked_sorted = None
+        self.dirty = True
+
+    def _count(self, item: StatisticsItem, passed: bool, delta: int) -> None:
+        categories = self._passed_categories if passed else self._blocked_categories
+        creators = self._passed_creators if passed else self._blocked_creators
+
+        for category in item.categories:
+            categories[category] += delta
+            if not categories[category]:
+                del categories[category]
+
+        creators[item.creator] += delta
+        if not creators[item.creator]:
+            del creators[item.creator]
 
     def add(self, item: FeedItem, passed: bool) -> None:
         target = self.passed if passed else self.blocked
@@ -101,73 +286,64 @@ class FilterStatistics:
         key = item.title
 
         if key in other:
-            del other[key]
+            self._count(other.pop(key), not passed, -1)
+
+        if key in target:
+            self._count(target[key], passed, -1)
+
+        stats_item = StatisticsItem(item.title, item.link, item.creator, tuple(item.categories))
+        target[key] = stats_item
+        self._count(stats_item, passed, 1)
+
+        self._passed_sorted = None
+        self._blocked_sorted = None
+        self.dirty = True
 
-        target[key] = item
+    @property
+    def passed_sorted(self) -> list[tuple[str, StatisticsItem]]:
+        if self._passed_sorted is None:
+            self._passed_sorted = sorted(self.passed.items())
+        return self._passed_sorted
+
+    @property
+    def blocked_sorted(self) -> list[tuple[str, StatisticsItem]]:
+        if self._blocked_sorted is None:
+            self._blocked_sorted = sorted(self.blocked.items())
+        return self._blocked_sorted
+
+    @staticmethod
+    def _sorted_counts(counter: Counter[str]) -> list[tuple[int, str]]:
+        return sorted(((count, key) for key, count in counter.items()), reverse=True)
 
     @property
     def passed_categories(self) -> list[tuple[int, str]]:
-        return sorted(
-            (
-                (count, key)
-                for key, count in Counter(
-                    category
-                    for item in self.passed.values()
-                    for category in item.categories
-                ).items()
-            ),
-            reverse=True
-        )
+        return self._sorted_counts(self._passed_categories)
 
     @property
     def blocked_categories(self) -> list[tuple[int, str]]:
-        return sorted(
-            (
-                (count, key)
-                for key, count in Counter(
-                    category
-                    for item in self.blocked.values()
-                    for category in item.categories
-                ).items()
-            ),
-            reverse=True
-        )
+        return self._sorted_counts(self._blocked_categories)
 
     @property
     def passed_creators(self) -> list[tuple[int, str]]:
-        return sorted(
-            (
-                (count, key)
-                for key, count in Counter(
-                    item.creator
-                    for item in self.passed.values()
-                ).items()
-            ),
-            reverse=True
-        )
+        return self._sorted_counts(self._passed_creators)
 
     @property
     def blocked_creators(self) -> list[tuple[int, str]]:
-        return sorted(
-            (
-                (count, key)
-                for key, count in Counter(
-                    item.creator
-                    for item in self.blocked.values()
-                ).items()
-            ),
-            reverse=True
-        )
+        return self._sorted_counts(self._blocked_creators)
 
 
+@lru_cache(maxsize=4096)
 def cleanup_link(link: str) -> str:
-    return link.split('?utm')[0]
+    return link.partition('?utm')[0]
 
 
-def parse_feed(content: str) -> Iterator[FeedItem]:
-    root = ET.fromstring(content)
+def parse_feed(content: bytes) -> Iterator[FeedItem]:
+    if HAVE_LXML:
+        events = ET.iterparse(io.BytesIO(content), events=('end',), tag='item')
+    else:
+        events = (event for event in ET.iterparse(io.BytesIO(content), events=('end',)) if event[1].tag == 'item')
 
-    for item in root.findall('channel/item'):
+    for _, item in events:
         yield FeedItem(
             title=item.find('title').text,  # type: ignore
             guid=item.find('guid').text,  # type: ignore
@@ -175,191 +351,270 @@ def parse_feed(content: str) -> Iterator[FeedItem]:
             link=cleanup_link(item.find('link').text),  # type: ignore
             description=item.find('description').text,  # type: ignore
             pub_date=item.find('pubDate').text,  # type: ignore
-            categories=[elt.text for elt in item.findall('category')],  # type: ignore
-            creator=item.find('{http://purl.org/dc/elements/1.1/}creator').text,  # type: ignore
+            categories=[sys.intern(elt.text) for elt in item.findall('category')],  # type: ignore
+            creator=sys.intern(item.find('{http://purl.org/dc/elements/1.1/}creator').text),  # type: ignore
         )
 
-
-def check_filters(item: FeedItem, filters: Iterable[FilterConfig]) -> bool:
-    for filt in filters:
-        if filt.title is not None and re.fullmatch(filt.title, item.title, re.IGNORECASE):
-            return True
-        if filt.category is not None and any(re.fullmatch(filt.category, category, re.IGNORECASE) for category in item.categories):
-            return True
-        if filt.creator is not None and re.fullmatch(filt.creator, item.creator, re.IGNORECASE):
-            return True
-    return False
+        # drop already processed items, so memory footprint does not grow with feed size
+        item.clear()
+        if HAVE_LXML:
+            while item.getprevious() is not None:
+                del item.getparent()[0]
 
 
 def process_feed_items(items: Iterable[FeedItem], feed_config: FeedConfig, stats: FilterStatistics) -> Iterator[FeedItem]:
     for item in FeedItem.unicalize(items):
-        if check_filters(item, feed_config.exclude) and not check_filters(item, feed_config.include):
+        if feed_config.exclude_matcher.match(item) and not feed_config.include_matcher.match(item):
             stats.add(item, False)
         else:
             stats.add(item, True)
             yield item
 
 
-def dump_feed(items: Iterable[FeedItem]) -> str:
-    root = ET.Element('rss')
+def dump_item(item: FeedItem) -> 'ET._Element':
+    item_elt = ET.Element('item')
 
-    ET.SubElement(root, 'title').text = 'habrss feed'
+    ET.SubElement(item_elt, 'title').text = item.title
+    guid_elt = ET.SubElement(item_elt, 'guid')
+    guid_elt.text = item.guid
+    if item.guid_permalink:
+        guid_elt.attrib['isPermaLink'] = item.guid_permalink
+    ET.SubElement(item_elt, 'link').text = item.link
+    ET.SubElement(item_elt, 'description').text = item.description
+    ET.SubElement(item_elt, 'pubDate').text = item.pub_date
 
-    channel = ET.SubElement(root, 'channel')
+    for category in item.categories:
+        ET.SubElement(item_elt, 'category').text = category
 
-    for item in items:
-        item_elt = ET.SubElement(channel, 'item')
+    ET.SubElement(item_elt, '{http://purl.org/dc/elements/1.1/}creator').text = item.creator
 
-        ET.SubElement(item_elt, 'title').text = item.title
-        guid_elt = ET.SubElement(item_elt, 'guid')
-        guid_elt.text = item.guid
-        if item.guid_permalink:
-            guid_elt.attrib['isPermaLink'] = item.guid_permalink
-        ET.SubElement(item_elt, 'link').text = item.link
-        ET.SubElement(item_elt, 'description').text = item.description
-        ET.SubElement(item_elt, 'pubDate').text = item.pub_date
+    return item_elt
 
-        for category in item.categories:
-            ET.SubElement(item_elt, 'category').text = category
 
-        ET.SubElement(item_elt, '{http://purl.org/dc/elements/1.1/}creator').text = item.creator
+async def dump_feed(items: Iterable[FeedItem], output: aiohttp.web.StreamResponse) -> None:
+    await output.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
 
-    return ET.tostring(root, encoding='unicode')
+    title_elt = ET.Element('title')
+    title_elt.text = 'habrss feed'
+
+    if HAVE_LXML:
+        # write items to the output as they are produced, never holding the whole document
+        async with ET.xmlfile(output, encoding='utf-8') as xf:
+            async with xf.element('rss'):
+                await xf.write(title_elt)
+                async with xf.element('channel'):
+                    for item in items:
+                        await xf.write(dump_item(item))
+    else:
+        root = ET.Element('rss')
+        root.append(title_elt)
+
+        channel = ET.SubElement(root, 'channel')
+
+        for item in items:
+            channel.append(dump_item(item))
+
+        await output.write(ET.tostring(root, encoding='utf-8'))
+
+
+_JINJA_ENV = jinja2.Environment(autoescape=True, auto_reload=False)
+
+_INDEX_TEMPLATE = _JINJA_ENV.from_string(
+    """
+    <html>
+    <head><title>Feeds list</title></head>
+    <body>
+    <h1>Feeds list</h1>
+    <ul>
+    {% for feed in feeds %}
+    <li><a href="{{ feed.name }}.rss">{{ feed.name }}</a></li>
+    {% endfor %}
+    </ul>
+    <p><a href="stats">Filter statistics</a></p>
+    </body>
+    </html>
+    """
+)
+
+_STATS_TEMPLATE = _JINJA_ENV.from_string(
+    """
+    <html>
+    <head><title>Filter statistics</title></head>
+    <body><h1>Filter statistics</h1>
+
+    <table>
+    <tr><th>Title</th><th>Creator</th><th>Categories</th></tr>
+    <tr><td colspan="3"><h3>Blocked</h3></td></tr>
+    {% for _, item in stats.blocked_sorted %}
+    <tr>
+    <td><a href="{{ item.link }}">{{ item.title }}</a></td>
+    <td>{{ item.creator }}</td>
+    <td>{{ item.categories | join(', ') }}</td>
+    </tr>
+    {% endfor %}
+    <tr><td colspan="3"><h3>Passed</h3></td></tr>
+    {% for _, item in stats.passed_sorted %}
+    <tr>
+    <td><a href="{{ item.link }}">{{ item.title }}</a></td>
+    <td>{{ item.creator }}</td>
+    <td>{{ item.categories | join(', ') }}</td>
+    </tr>
+    {% endfor %}
+    </table>
+
+    <h3>Blocked categories</h3>
+    <table>
+    <tr><th>Category</th><th>Count</th></tr>
+    {% for cat, count in stats.blocked_categories %}
+    <tr><td>{{ cat }}</td><td>{{ count }}</td></tr>
+    {% endfor %}
+    </table>
+
+    <h3>Passed categories</h3>
+    <table>
+    <tr><th>Category</th><th>Count</th></tr>
+    {% for cat, count in stats.passed_categories %}
+    <tr><td>{{ cat }}</td><td>{{ count }}</td></tr>
+    {% endfor %}
+    </table>
+
+    <h3>Blocked creators</h3>
+    <table>
+    <tr><th>Category</th><th>Count</th></tr>
+    {% for creator, count in stats.blocked_creators %}
+    <tr><td>{{ creator }}</td><td>{{ count }}</td></tr>
+    {% endfor %}
+    </table>
+
+    <h3>Passed creators</h3>
+    <table>
+    <tr><th>Category</th><th>Count</th></tr>
+    {% for creator, count in stats.passed_creators %}
+    <tr><td>{{ creator }}</td><td>{{ count }}</td></tr>
+    {% endfor %}
+    </table>
+
+    </body>
+    </html>
+    """
+)
 
 
 class Handler:
     _config: FeedsConfig
+    _feeds_by_name: dict[str, FeedConfig]
     _stats: FilterStatistics
-
-    _index_template: jinja2.Template
-    _stats_template: jinja2.Template
+    _stats_cache: Optional[bytes]
+    _session: Optional[aiohttp.ClientSession]
+    _upstream_cache: dict[str, UpstreamFeed]
 
     def __init__(self, config: FeedsConfig) -> None:
         self._config = config
+        # first config wins on duplicate names, as with the former linear lookup
+        self._feeds_by_name = {feed_config.name: feed_config for feed_config in reversed(config.feeds)}
         self._stats = FilterStatistics()
-        self._index_template = jinja2.Template(
-            """
-            <html>
-            <head><title>Feeds list</title></head>
-            <body>
-            <h1>Feeds list</h1>
-            <ul>
-            {% for feed in feeds %}
-            <li><a href="{{ feed.name }}.rss">{{ feed.name }}</a></li>
-            {% endfor %}
-            </ul>
-            <p><a href="stats">Filter statistics</a></p>
-            </body>
-            </html>
-            """
-        )
-        self._stats_template = jinja2.Template(
-            """
-            <html>
-            <head><title>Filter statistics</title></head>
-            <body><h1>Filter statistics</h1>
-
-            <table>
-            <tr><th>Title</th><th>Creator</th><th>Categories</th></tr>
-            <tr><td colspan="3"><h3>Blocked</h3></td></tr>
-            {% for _, item in stats.blocked.items()|sort %}
-            <tr>
-            <td><a href="{{ item.link }}">{{ item.title }}</a></td>
-            <td>{{ item.creator }}</td>
-            <td>{{ item.categories | join(', ') }}</td>
-            </tr>
-            {% endfor %}
-            <tr><td colspan="3"><h3>Passed</h3></td></tr>
-            {% for _, item in stats.passed.items()|sort %}
-            <tr>
-            <td><a href="{{ item.link }}">{{ item.title }}</a></td>
-            <td>{{ item.creator }}</td>
-            <td>{{ item.categories | join(', ') }}</td>
-            </tr>
-            {% endfor %}
-            </table>
-
-            <h3>Blocked categories</h3>
-            <table>
-            <tr><th>Category</th><th>Count</th></tr>
-            {% for cat, count in stats.blocked_categories %}
-            <tr><td>{{ cat }}</td><td>{{ count }}</td></tr>
-            {% endfor %}
-            </table>
-
-            <h3>Passed categories</h3>
-            <table>
-            <tr><th>Category</th><th>Count</th></tr>
-            {% for cat, count in stats.passed_categories %}
-            <tr><td>{{ cat }}</td><td>{{ count }}</td></tr>
-            {% endfor %}
-            </table>
-
-            <h3>Blocked creators</h3>
-            <table>
-            <tr><th>Category</th><th>Count</th></tr>
-            {% for creator, count in stats.blocked_creators %}
-            <tr><td>{{ creator }}</td><td>{{ count }}</td></tr>
-            {% endfor %}
-            </table>
-
-            <h3>Passed creators</h3>
-            <table>
-            <tr><th>Category</th><th>Count</th></tr>
-            {% for creator, count in stats.passed_creators %}
-            <tr><td>{{ creator }}</td><td>{{ count }}</td></tr>
-            {% endfor %}
-            </table>
-
-            </body>
-            </html>
-            """
-        )
+        self._stats_cache = None
+        self._session = None
+        self._upstream_cache = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # session must be created inside a running event loop, so do it lazily
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, limit_per_host=8, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self, app: aiohttp.web.Application) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _fetch_feed(self, url: str, headers: dict[str, str]) -> UpstreamFeed:
+        if (cached := self._upstream_cache.get(url)) is not None:
+            headers = dict(headers)  # copy shared headers only when adding validators
+            if cached.etag is not None:
+                headers['if-none-match'] = cached.etag
+            if cached.last_modified is not None:
+                headers['if-modified-since'] = cached.last_modified
+
+        async with self._get_session().get(url, headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                return cached
+
+            feed = UpstreamFeed(
+                etag=response.headers.get('etag'),
+                last_modified=response.headers.get('last-modified'),
+                content_type=response.headers['content-type'].split(';', 1)[0],
+                items=list(parse_feed(await response.read())),
+            )
+
+            if response.status == 200 and (feed.etag is not None or feed.last_modified is not None):
+                self._upstream_cache[url] = feed
+
+            return feed
 
     async def handle_index(self, request):
         return aiohttp.web.Response(
-            text=self._index_template.render(feeds=self._config.feeds),
+            text=_INDEX_TEMPLATE.render(feeds=self._config.feeds),
             content_type='text/html'
         )
 
     async def handle_feed(self, request):
-        feed_name = request.match_info['name']
-        for feed_config in self._config.feeds:
-            if feed_config.name == feed_name:
-                break
-        else:
+        feed_config = self._feeds_by_name.get(request.match_info['name'])
+        if feed_config is None:
             raise aiohttp.web.HTTPNotFound()
 
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                session.get(
-                    url,
-                    headers={
-                        'user-agent': request.headers['user-agent']
-                    }
-                ) for url in feed_config.urls
-            ]
+        headers = {
+            'user-agent': request.headers['user-agent']
+        }
 
-            responses = await asyncio.gather(*tasks)
+        semaphore = asyncio.Semaphore(8)
 
-            content_type = responses[0].headers['content-type'].split(';', 1)[0]
+        async def fetch(url: str) -> UpstreamFeed:
+            async with semaphore:
+                return await asyncio.wait_for(self._fetch_feed(url, headers), timeout=10)
 
-            contents = [await response.text() for response in responses]
+        results = await asyncio.gather(*map(fetch, feed_config.urls), return_exceptions=True)
 
-            result = '<?xml version="1.0" encoding="UTF-8"?>\n' + dump_feed(
-                process_feed_items(
-                    itertools.chain(*map(parse_feed, contents)),
-                    feed_config,
-                    self._stats,
-                )
-            )
+        feeds = []
+        for url, result in zip(feed_config.urls, results):
+            if isinstance(result, BaseException):
+                logging.warning(f'failed to fetch {url}: {result!r}')
+            else:
+                feeds.append(result)
+
+        if not feeds:
+            raise aiohttp.web.HTTPBadGateway()
+
+        content_type = feeds[0].content_type
 
-            return aiohttp.web.Response(text=result, content_type=content_type)
+        response = aiohttp.web.StreamResponse()
+        response.content_type = content_type
+        response.charset = 'utf-8'
+        await response.prepare(request)
+
+        await dump_feed(
+            process_feed_items(
+                itertools.chain.from_iterable(feed.items for feed in feeds),
+                feed_config,
+                self._stats,
+            ),
+            response
+        )
+
+        await response.write_eof()
+        return response
 
     async def handle_stats(self, request):
+        if self._stats_cache is None or self._stats.dirty:
+            self._stats_cache = _STATS_TEMPLATE.render(stats=self._stats).encode('utf-8')
+            self._stats.dirty = False
+
         return aiohttp.web.Response(
-            text=self._stats_template.render(stats=self._stats),
-            content_type='text/html'
+            body=self._stats_cache,
+            content_type='text/html',
+            charset='utf-8'
         )
 
 
@@ -389,6 +644,7 @@ def main():
         aiohttp.web.get('/{name}.rss', handler.handle_feed),
         aiohttp.web.get('/stats', handler.handle_stats),
     ])
+    app.on_cleanup.append(handler.close)
     aiohttp.web.run_app(app, host=args.host, port=args.port)
 
 